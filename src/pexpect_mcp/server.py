@@ -1,14 +1,15 @@
+import os
 import sys
 import re
 import time
-import traceback
 import threading
-from io import StringIO
+from collections import deque
 from typing import Any, Dict, Optional, Union, List
-from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 
 # Platform-specific imports
 if sys.platform != "win32":
+    import select
+    import selectors
     import signal
     HAS_SIGALRM = True
 else:
@@ -16,8 +17,6 @@ else:
 
 # Import pexpect or create pywinpty wrapper based on platform
 if sys.platform == "win32":
-    from winpty import PtyProcess
-
     class EOF:
         """Sentinel for end-of-file."""
         pass
@@ -26,6 +25,25 @@ if sys.platform == "win32":
         """Sentinel for timeout."""
         pass
 
+    class _LiteralMatch:
+        """Minimal re.Match stand-in for literals located with str.find."""
+
+        __slots__ = ("_start", "_end", "_text")
+
+        def __init__(self, start: int, end: int, text: str):
+            self._start = start
+            self._end = end
+            self._text = text
+
+        def start(self) -> int:
+            return self._start
+
+        def end(self) -> int:
+            return self._end
+
+        def group(self, *args) -> str:
+            return self._text
+
     class WinPtySpawn:
         """Pexpect-like wrapper around pywinpty for Windows."""
 
@@ -34,13 +52,21 @@ if sys.platform == "win32":
 
         def __init__(self, command: str):
             """Spawn a process using pywinpty."""
+            # Deferred so importing this module doesn't pay for winpty until
+            # something is actually spawned
+            from winpty import PtyProcess
+
             self.proc = PtyProcess.spawn(command)
-            self.buffer = ""
+            self._buf_chunks: List[str] = []
+            self._buf_cache: Optional[str] = ""
             self.before = ""
             self.after = ""
             self.match = None
             self.timeout = 30  # default timeout
-            self._lock = threading.Lock()
+            self._chunks: deque = deque()
+            self._data_event = threading.Event()
+            self._searcher_cache: Dict[tuple, tuple] = {}
+            self._re_cache: Dict[str, re.Pattern] = {}
             self._reader_thread = None
             self._stop_reader = False
             self._start_reader_thread()
@@ -48,20 +74,89 @@ if sys.platform == "win32":
         def _start_reader_thread(self):
             """Start a background thread to continuously read from the process."""
             def reader():
-                while not self._stop_reader and self.proc.isalive():
+                while not self._stop_reader:
                     try:
-                        # Read in small chunks
-                        data = self.proc.read(1)
-                        if data:
-                            with self._lock:
-                                self.buffer += data
+                        # PtyProcess.read blocks until output is available,
+                        # so no sleep is needed between reads
+                        data = self.proc.read(4096)
                     except:
                         break
-                    time.sleep(0.001)  # Small sleep to prevent CPU spin
+                    if data:
+                        self._chunks.append(data)
+                        self._data_event.set()
 
             self._reader_thread = threading.Thread(target=reader, daemon=True)
             self._reader_thread.start()
 
+        def _compile(self, pattern: str) -> re.Pattern:
+            """Compile a pattern once per session, with pexpect's DOTALL semantics.
+
+            The stdlib's own re cache is small and shared globally, so
+            long-lived sessions with many dynamic patterns would otherwise
+            re-parse on every expect call. Bounded by evicting the oldest
+            entry, the same policy as the searcher cache.
+            """
+            compiled = self._re_cache.get(pattern)
+            if compiled is None:
+                compiled = re.compile(pattern, re.DOTALL)
+                if len(self._re_cache) >= 128:
+                    self._re_cache.pop(next(iter(self._re_cache)))
+                self._re_cache[pattern] = compiled
+            return compiled
+
+        def _get_searcher(self, key: tuple) -> tuple:
+            """Return (compiled alternation, group slots) for a tuple of patterns.
+
+            All patterns are joined into a single ``(p0)|(p1)|...`` regex so one
+            engine pass covers every pattern. ``slots`` holds the group number
+            of each pattern's wrapping group (user patterns may contain their
+            own groups, shifting the numbering), letting the caller recover
+            which alternative matched.
+            """
+            entry = self._searcher_cache.get(key)
+            if entry is None:
+                parts = []
+                slots = []
+                group_no = 1
+                for p in key:
+                    slots.append(group_no)
+                    parts.append("(" + p + ")")
+                    group_no += 1 + self._compile(p).groups
+                entry = (re.compile("|".join(parts), re.DOTALL), slots)
+                if len(self._searcher_cache) >= 32:
+                    self._searcher_cache.pop(next(iter(self._searcher_cache)))
+                self._searcher_cache[key] = entry
+            return entry
+
+        def _drain_chunks(self) -> None:
+            """Collect chunks from the reader thread, invalidating the cached str.
+
+            Single producer (reader thread) appends, single consumer (this
+            thread) pops; deque.append and deque.popleft are each atomic
+            under the GIL, so no lock is needed.
+            """
+            drained = False
+            while self._chunks:
+                self._buf_chunks.append(self._chunks.popleft())
+                drained = True
+            if drained:
+                self._buf_cache = None
+
+        @property
+        def buffer(self) -> str:
+            """Accumulated output as a str, materialized lazily from chunks."""
+            self._drain_chunks()
+            if self._buf_cache is None:
+                self._buf_cache = "".join(self._buf_chunks)
+                # Collapse so the next invalidation doesn't re-join old chunks
+                self._buf_chunks = [self._buf_cache] if self._buf_cache else []
+            return self._buf_cache
+
+        @buffer.setter
+        def buffer(self, data: str) -> None:
+            self._buf_chunks = [data] if data else []
+            self._buf_cache = data
+
         def expect(self, pattern: Union[str, type, List], timeout: Optional[int] = None) -> int:
             """Wait for pattern to appear in output.
 
@@ -81,54 +176,104 @@ if sys.platform == "win32":
             else:
                 patterns = [pattern]
 
+            # Compile all string patterns into one alternation so each poll is
+            # a single engine pass
+            str_pats = [(i, p) for i, p in enumerate(patterns) if isinstance(p, str)]
+            max_pat_len = max((len(p) for _, p in str_pats), default=0)
+
+            # Pure literals (the common case: ">>>", "(lldb)", "21") can skip
+            # the regex engine entirely in favor of str.find, which runs
+            # CPython's optimized C substring search
+            all_literal = all(re.escape(p) == p for _, p in str_pats)
+            searcher = (
+                self._get_searcher(tuple(p for _, p in str_pats))
+                if str_pats and not all_literal
+                else None
+            )
+
+            # Sentinels are classes, so identity is the right comparison;
+            # resolve them once here instead of filtering on every poll
+            # (TIMEOUT is handled by the timeout logic itself)
+            eof_idx = next((i for i, p in enumerate(patterns) if p is EOF), -1)
+
+            # Offset into the buffer that previous polls of *this call* have
+            # already searched. Per-call state: a new expect() may carry
+            # patterns that match data an earlier call never looked for.
+            scan_pos = 0
+
             start_time = time.time()
 
             while True:
                 # Check timeout
                 elapsed = time.time() - start_time
                 if elapsed >= timeout:
-                    with self._lock:
-                        buf_snapshot = self.buffer[:500]
+                    buf_snapshot = self.buffer[:500]
                     raise TimeoutError(f"Timeout waiting for pattern after {timeout}s. Buffer: {repr(buf_snapshot)}")
 
                 # Check for EOF
                 if not self.proc.isalive():
-                    # Give reader thread time to finish
-                    time.sleep(0.1)
-
-                    # Check if any pattern is EOF
-                    for i, p in enumerate(patterns):
-                        if p is EOF or p == EOF:
-                            with self._lock:
-                                self.before = self.buffer
-                                self.after = ""
-                                self.buffer = ""
-                            return i
-
-                    with self._lock:
-                        buf_snapshot = self.buffer
-                    raise EOFError(f"Process ended without matching pattern. Buffer: {repr(buf_snapshot)}")
-
-                # Check patterns against buffer (thread-safe)
-                with self._lock:
-                    for i, p in enumerate(patterns):
-                        if p is EOF or p == EOF:
-                            continue  # EOF checked above
-                        if p is TIMEOUT or p == TIMEOUT:
-                            continue  # TIMEOUT handled by timeout logic
-
-                        # String pattern matching
-                        if isinstance(p, str):
-                            match = re.search(p, self.buffer)
-                            if match:
-                                self.before = self.buffer[:match.start()]
-                                self.after = match.group()
-                                self.match = match
-                                self.buffer = self.buffer[match.end():]
-                                return i
-
-                # Small sleep to avoid busy waiting
-                time.sleep(0.01)
+                    # Wait for the reader to hand over the final output; its
+                    # blocking read returns promptly once the process is gone,
+                    # so this is typically immediate rather than a fixed sleep
+                    self._stop_reader = True
+                    if self._reader_thread:
+                        self._reader_thread.join(timeout=0.5)
+
+                    if eof_idx != -1:
+                        self.before = self.buffer
+                        self.after = ""
+                        self.buffer = ""
+                        return eof_idx
+
+                    raise EOFError(f"Process ended without matching pattern. Buffer: {repr(self.buffer)}")
+
+                # Check patterns against buffer (only this thread mutates it)
+                if str_pats:
+                    buf = self.buffer
+                    match = None
+                    match_idx = -1
+
+                    if all_literal:
+                        # A literal's match is exactly its source, so rewinding
+                        # the scan start by the longest literal is enough to
+                        # catch matches straddling the previous poll's end;
+                        # earliest-position match wins, same as the alternation
+                        scan_start = max(0, scan_pos - max_pat_len)
+                        for orig_i, p in str_pats:
+                            pos = buf.find(p, scan_start)
+                            if pos != -1 and (match is None or pos < match.start()):
+                                match = _LiteralMatch(pos, pos + len(p), p)
+                                match_idx = orig_i
+                    else:
+                        # A regex's source length says nothing about its match
+                        # length ('a.*b' can match megabytes), so regexes always
+                        # rescan from the start of the buffer
+                        regex, slots = searcher
+                        match = regex.search(buf)
+                        if match:
+                            # Recover which alternative matched from its group slot
+                            for slot, (orig_i, _) in zip(slots, str_pats):
+                                if match.group(slot) is not None:
+                                    match_idx = orig_i
+                                    break
+
+                    if match is not None:
+                        self.before = buf[:match.start()]
+                        self.after = match.group()
+                        self.match = match
+                        self.buffer = buf[match.end():]
+                        return match_idx
+
+                    # Nothing matched; the literal path only needs to scan
+                    # newly arrived data on the next poll
+                    scan_pos = len(buf)
+
+                # Sleep until the reader signals new data (bounded so we still
+                # notice process exit and timeouts); clear before rescanning so
+                # data arriving mid-scan isn't missed
+                remaining = timeout - (time.time() - start_time)
+                self._data_event.wait(timeout=min(0.5, max(0.0, remaining)))
+                self._data_event.clear()
 
         def sendline(self, text: str = "") -> None:
             """Send text followed by newline."""
@@ -152,12 +297,13 @@ if sys.platform == "win32":
         def close(self) -> None:
             """Close the process."""
             self._stop_reader = True
-            if self._reader_thread:
-                self._reader_thread.join(timeout=1)
+            # Close the process first so the reader's blocking read returns
             try:
                 self.proc.close()
             except:
                 pass
+            if self._reader_thread:
+                self._reader_thread.join(timeout=1)
 
         def __del__(self):
             """Cleanup on deletion."""
@@ -181,12 +327,18 @@ mcp = FastMCP("pexpect-mcp")
 
 # Global timeout setting (can be overridden by tool caller)
 TIMEOUT = 12
-# Default pexpect timeout (2 seconds less than hard timeout to avoid signal timeout)
-DEFAULT_PEXPECT_TIMEOUT = TIMEOUT - 2
+# Default pexpect timeout (slightly less than the hard timeout so pexpect's
+# own timeout fires before the interval timer; setitimer takes floats, so
+# 200ms of headroom is enough)
+DEFAULT_PEXPECT_TIMEOUT = TIMEOUT - 0.2
 
 pexpect_session: Optional[pexpect.spawn] = None
 session_globals: Dict[str, Any] = {}
 
+# Distinguishes "name was absent" from "name was bound to None" when stashing
+# the injected per-call names
+_MISSING = object()
+
 
 class TimeoutError(Exception):
     """Raised when pexpect operation times out."""
@@ -200,6 +352,152 @@ if HAS_SIGALRM:
         raise TimeoutError("Operation timed out after {} seconds".format(TIMEOUT))
 
 
+if not HAS_SIGALRM:
+    # Only the thread-based timeout path needs an executor; keep the import
+    # out of Unix startup
+    from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+
+    # Long-lived worker for the thread-based timeout path. Created lazily and
+    # replaced only when a timed-out task is still occupying the single thread.
+    _worker: Optional[ThreadPoolExecutor] = None
+    _worker_future = None  # last submitted task, kept to detect a stuck worker
+
+    def _get_worker() -> ThreadPoolExecutor:
+        global _worker
+        if _worker is None or (_worker_future is not None and not _worker_future.done()):
+            # The previous task is still hogging the thread (Python can't kill
+            # it); abandon that executor and start a fresh one
+            if _worker is not None:
+                _worker.shutdown(wait=False)
+            _worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pexpect-tool")
+        return _worker
+
+    def _submit_to_worker(fn):
+        global _worker_future
+        _worker_future = _get_worker().submit(fn)
+        return _worker_future
+
+
+# Bounds on persisted session state: once the total estimate passes
+# _MAX_SESSION_BYTES, values larger than _BIG_VALUE_BYTES are evicted
+# oldest-first
+_BIG_VALUE_BYTES = 1 << 20
+_MAX_SESSION_BYTES = 64 << 20
+
+
+def _prune_session_globals() -> None:
+    """Evict the oldest oversized session entries once the total grows too big.
+
+    Interactive debug sessions can leave multi-megabyte transcript dumps
+    bound to session variables forever, bloating RAM and slowing every later
+    call. sys.getsizeof is a shallow estimate, but it catches the common
+    offenders (large str/bytes buffers) without a deep traversal. The live
+    'child' session is never evicted.
+    """
+    total = 0
+    for value in session_globals.values():
+        try:
+            total += sys.getsizeof(value)
+        except TypeError:
+            pass
+    if total <= _MAX_SESSION_BYTES:
+        return
+    for key in list(session_globals):
+        if key == "child":
+            continue
+        try:
+            size = sys.getsizeof(session_globals[key])
+        except TypeError:
+            continue
+        if size > _BIG_VALUE_BYTES:
+            del session_globals[key]
+            total -= size
+            if total <= _MAX_SESSION_BYTES:
+                break
+
+
+# Compiled code objects keyed by source, since tool calls often repeat
+# boilerplate snippets
+_code_cache: Dict[str, tuple] = {}
+
+
+def _compile_code(code: str) -> tuple:
+    """Compile tool code once, returning (code object, is_expression).
+
+    Expression-ness is decided at compile time rather than by catching
+    SyntaxError from eval() on every call, and the result is cached so
+    repeated snippets skip compilation entirely.
+    """
+    entry = _code_cache.get(code)
+    if entry is None:
+        try:
+            entry = (compile(code, "<tool>", "eval"), True)
+        except SyntaxError:
+            entry = (compile(code, "<tool>", "exec"), False)
+        if len(_code_cache) >= 128:
+            _code_cache.pop(next(iter(_code_cache)))
+        _code_cache[code] = entry
+    return entry
+
+
+if sys.platform != "win32":
+    def _bulk_drain(child, timeout: float = 1.0) -> str:
+        """Drain pending output from a spawned child in large reads.
+
+        Reads straight from the PTY fd with os.read in 64KB chunks instead of
+        going through pexpect's per-call read_nonblocking machinery — useful
+        for dumping long transcripts where no pattern matching is needed.
+        Returns whatever arrived before the timeout.
+        """
+        deadline = time.monotonic() + timeout
+        out = []
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            ready, _, _ = select.select([child.child_fd], [], [], remaining)
+            if not ready:
+                break
+            try:
+                chunk = os.read(child.child_fd, 65536)
+            except OSError:
+                break
+            if not chunk:
+                break
+            out.append(chunk)
+        return b"".join(out).decode("utf-8", errors="replace")
+
+    # Attach at class level so the helper exists as soon as pexpect.spawn()
+    # returns, including within the same tool call that spawned the child
+    pexpect.spawn.bulk_drain = _bulk_drain
+
+    _orig_read_nonblocking = pexpect.spawn.read_nonblocking
+
+    def _selector_read_nonblocking(self, size=1000, timeout=-1):
+        """read_nonblocking that waits on a persistent selector.
+
+        pexpect rebuilds a select() fd set on every read_nonblocking call;
+        registering the PTY fd once in an epoll/kqueue-backed selector
+        amortizes that setup across the thousands of polls a hot expect loop
+        performs. Once the fd is ready, delegate to the original with a zero
+        timeout so its EOF and decode handling stays untouched.
+        """
+        if timeout == -1:
+            timeout = self.timeout
+        if timeout is not None and timeout > 0 and not self.closed:
+            sel = getattr(self, "_mcp_selector", None)
+            if sel is None:
+                sel = selectors.DefaultSelector()
+                sel.register(self.child_fd, selectors.EVENT_READ)
+                self._mcp_selector = sel
+            if not sel.select(timeout):
+                raise pexpect.TIMEOUT("Timeout exceeded.")
+            timeout = 0
+        return _orig_read_nonblocking(self, size, timeout)
+
+    pexpect.spawn.read_nonblocking = _selector_read_nonblocking
+
+
 def safe_str(obj: Any) -> str:
     """Safely convert object to string, handling bytes and other types."""
     if isinstance(obj, bytes):
@@ -233,6 +531,9 @@ def pexpect_tool(code: str, timeout: Optional[int] = None) -> str:
 
     When asked to dump out a pexpect transcript, make sure to dump with uv --script dependency info
     so the user can run it with "uv run session.py"
+
+    On Unix the spawned child also gets a `child.bulk_drain(timeout=1.0)` helper
+    that reads pending output in large chunks — prefer it for long transcript dumps.
     """
     if not code:
         return "No code provided"
@@ -242,99 +543,106 @@ def pexpect_tool(code: str, timeout: Optional[int] = None) -> str:
     # Use provided timeout or global default
     actual_timeout = timeout if timeout is not None else TIMEOUT
     # Use shorter timeout for pexpect operations
-    pexpect_timeout = (
-        min(actual_timeout - 2, DEFAULT_PEXPECT_TIMEOUT) if actual_timeout > 2 else 1
-    )
+    pexpect_timeout = max(0.05, min(actual_timeout - 0.2, DEFAULT_PEXPECT_TIMEOUT))
 
-    # Set up print capture
-    captured_output = StringIO()
-    original_print = print
+    # Set up print capture: format once into a list joined at the end.
+    # stdout carries the MCP stdio protocol, so even the PEXPECT_MCP_DEBUG
+    # echo goes to stderr — writing to stdout would corrupt the JSON-RPC
+    # stream.
+    capture_buf: List[str] = []
+    debug_echo = os.environ.get("PEXPECT_MCP_DEBUG")
 
     def captured_print(*args, **kwargs):
-        # Print to our capture buffer
-        kwargs_copy = kwargs.copy()
-        kwargs_copy["file"] = captured_output
-        original_print(*args, **kwargs_copy)
-        # Also print to stdout for debugging if needed
-        original_print(*args, **kwargs)
-
-    # Set up the execution environment
-    local_vars = session_globals.copy()
-    local_vars["pexpect"] = pexpect
-    local_vars["print"] = captured_print  # Inject our custom print function
+        sep = kwargs.get("sep", " ")
+        end = kwargs.get("end", "\n")
+        capture_buf.append(sep.join(map(str, args)) + end)
+        if debug_echo:
+            print(*args, **{**kwargs, "file": sys.stderr})
+
+    # Names injected for the duration of the call
+    overrides = {"pexpect": pexpect, "print": captured_print}
 
     # If we have an active session, make it available as 'child'
     if pexpect_session is not None:
-        local_vars["child"] = pexpect_session
+        overrides["child"] = pexpect_session
         # Set default timeout for pexpect operations
         pexpect_session.timeout = pexpect_timeout
 
     if HAS_SIGALRM:
-        # Unix: Use signal-based timeout
+        # Unix: Use signal-based timeout. The timeout interrupts this same
+        # thread, so the executed code is the only thing that can see the
+        # injected names — safe to run straight in the persistent namespace
+        # with no post-call dict walk. Stash what the injected names shadow;
+        # _restore_overrides puts it back on every exit path ('child' stays).
+        saved = {k: session_globals.get(k, _MISSING) for k in ("pexpect", "print")}
+        session_globals.update(overrides)
+
         old_handler = signal.signal(signal.SIGALRM, timeout_handler)
-        signal.alarm(actual_timeout)
+        signal.setitimer(signal.ITIMER_REAL, actual_timeout)
 
         try:
-            # Try to execute as an expression first
-            result = eval(code, {"__builtins__": __builtins__}, local_vars)
-            _update_globals(local_vars, pexpect_timeout)
+            code_obj, is_expr = _compile_code(code)
+            if is_expr:
+                result = eval(code_obj, {"__builtins__": __builtins__}, session_globals)
+            else:
+                exec(code_obj, {"__builtins__": __builtins__}, session_globals)
+                result = "Code executed successfully"
+            _update_globals(pexpect_timeout)
 
             # Format the response
-            return _format_response(result, captured_output.getvalue())
-
-        except SyntaxError:
-            # If it's not an expression, try executing as a statement
-            try:
-                exec(code, {"__builtins__": __builtins__}, local_vars)
-                _update_globals(local_vars, pexpect_timeout)
-                return _format_response(
-                    "Code executed successfully", captured_output.getvalue()
-                )
-
-            except Exception as exec_error:
-                return _format_response(f"Error: {exec_error}", captured_output.getvalue())
+            return _format_response(result, "".join(capture_buf))
 
         except TimeoutError as timeout_error:
-            # Format timeout error with traceback
-            tb = traceback.format_exc()
-            error_msg = f"Timeout Error: {timeout_error}\n\nTraceback:\n{tb}"
-            return _format_response(error_msg, captured_output.getvalue())
+            error_msg = f"Timeout Error: {timeout_error}"
+            # Walking and formatting the whole frame stack (deep in pexpect
+            # internals) is only worth paying for when someone is debugging
+            if debug_echo:
+                import traceback
+
+                error_msg += "\n\nTraceback:\n" + traceback.format_exc()
+            return _format_response(error_msg, "".join(capture_buf))
 
         except Exception as eval_error:
-            return _format_response(f"Error: {eval_error}", captured_output.getvalue())
+            return _format_response(f"Error: {eval_error}", "".join(capture_buf))
 
         finally:
-            # Always clean up the alarm and restore old handler
-            signal.alarm(0)
+            # Always clean up the timer, restore old handler, and put back
+            # whatever the injected names shadowed
+            signal.setitimer(signal.ITIMER_REAL, 0)
             signal.signal(signal.SIGALRM, old_handler)
+            _restore_overrides(saved)
     else:
-        # Windows: Use threading-based timeout
+        # Windows: Use threading-based timeout. A timed-out worker can't be
+        # killed, so it must never execute in the shared session dict — an
+        # abandoned task would keep mutating it concurrently with later calls
+        # (and would see 'print' restored to the builtin out from under it,
+        # corrupting the stdio stream). Run in a private per-call namespace
+        # and merge it back only if the code finished in time.
+        abandoned = threading.Event()
+
         def execute_code():
-            try:
-                # Try to execute as an expression first
-                result = eval(code, {"__builtins__": __builtins__}, local_vars)
-                _update_globals(local_vars, pexpect_timeout)
-                return _format_response(result, captured_output.getvalue())
-            except SyntaxError:
-                # If it's not an expression, try executing as a statement
-                exec(code, {"__builtins__": __builtins__}, local_vars)
-                _update_globals(local_vars, pexpect_timeout)
-                return _format_response(
-                    "Code executed successfully", captured_output.getvalue()
-                )
+            local_vars = {**session_globals, **overrides}
+            code_obj, is_expr = _compile_code(code)
+            if is_expr:
+                result = eval(code_obj, {"__builtins__": __builtins__}, local_vars)
+            else:
+                exec(code_obj, {"__builtins__": __builtins__}, local_vars)
+                result = "Code executed successfully"
+            if not abandoned.is_set():
+                _merge_session(local_vars, pexpect_timeout)
+            return _format_response(result, "".join(capture_buf))
 
         try:
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(execute_code)
-                result = future.result(timeout=actual_timeout)
-                return result
+            future = _submit_to_worker(execute_code)
+            return future.result(timeout=actual_timeout)
 
         except FuturesTimeoutError:
+            abandoned.set()
             error_msg = f"Timeout Error: Operation timed out after {actual_timeout} seconds"
-            return _format_response(error_msg, captured_output.getvalue())
+            return _format_response(error_msg, "".join(capture_buf))
 
         except Exception as error:
-            return _format_response(f"Error: {error}", captured_output.getvalue())
+            return _format_response(f"Error: {error}", "".join(capture_buf))
 
 
 def _format_response(result, log_output):
@@ -348,20 +656,50 @@ def _format_response(result, log_output):
     return "\n".join(response_parts)
 
 
-def _update_globals(local_vars, pexpect_timeout):
+def _update_globals(pexpect_timeout):
     global pexpect_session
-    for key, value in local_vars.items():
-        if key not in [
-            "__builtins__",
-            "pexpect",
-            "print",
-        ]:  # Don't persist the custom print function
+    # Executed code writes into session_globals itself, so there is nothing
+    # to sync back; just pick up a new 'child' with a single lookup
+    child = session_globals.get("child")
+    if isinstance(child, pexpect.spawn):
+        pexpect_session = child
+        # Set default timeout for the new session
+        pexpect_session.timeout = pexpect_timeout
+
+    _prune_session_globals()
+
+
+def _merge_session(local_vars, pexpect_timeout):
+    """Merge a completed thread-path call's private namespace into the session.
+
+    Only reached when the task finished before its timeout, so nothing else
+    is touching session_globals. The injected names are simply left out
+    rather than stashed and restored.
+    """
+    global pexpect_session
+    child = local_vars.get("child")
+    if isinstance(child, pexpect.spawn):
+        pexpect_session = child
+        # Set default timeout for the new session
+        pexpect_session.timeout = pexpect_timeout
+
+    session_globals.update(
+        {k: v for k, v in local_vars.items() if k not in ("__builtins__", "pexpect", "print")}
+    )
+    _prune_session_globals()
+
+
+def _restore_overrides(saved: Dict[str, Any]) -> None:
+    """Put back whatever the injected per-call names shadowed.
+
+    'child' is deliberately not restored: it either still refers to the live
+    session or was rebound by the executed code, and both should persist.
+    """
+    for key, value in saved.items():
+        if value is _MISSING:
+            session_globals.pop(key, None)
+        else:
             session_globals[key] = value
-            # If a 'child' variable was created/modified, update our session
-            if key == "child" and isinstance(value, pexpect.spawn):
-                pexpect_session = value
-                # Set default timeout for the new session
-                pexpect_session.timeout = pexpect_timeout
 
 
 def main():
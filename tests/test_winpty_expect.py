@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Regression tests for WinPtySpawn.expect pattern scanning.
+
+Runs on any platform by stubbing the winpty module and importing the server
+as if on Windows, driving the reader thread through a fake PtyProcess.
+"""
+import importlib
+import queue
+import sys
+import threading
+import types
+
+
+class FakePtyProcess:
+    """Blocking-read stand-in for winpty.PtyProcess."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._alive = True
+
+    @classmethod
+    def spawn(cls, command):
+        return cls()
+
+    def feed(self, data):
+        """Make data available to the next blocking read."""
+        self._queue.put(data)
+
+    def read(self, size=4096):
+        data = self._queue.get()
+        if data is None:
+            raise EOFError("pty closed")
+        return data
+
+    def write(self, data):
+        pass
+
+    def isalive(self):
+        return self._alive
+
+    def close(self):
+        self._alive = False
+        self._queue.put(None)
+
+
+def load_win32_server():
+    """Import pexpect_mcp.server as if on Windows, with winpty stubbed."""
+    # Import mcp (and its ssl/anyio chain) before faking the platform, since
+    # those modules make their own sys.platform checks at import time
+    importlib.import_module("mcp.server.fastmcp")
+
+    fake_winpty = types.ModuleType("winpty")
+    fake_winpty.PtyProcess = FakePtyProcess
+    sys.modules["winpty"] = fake_winpty
+    sys.modules.pop("pexpect_mcp.server", None)
+    real_platform = sys.platform
+    sys.platform = "win32"
+    try:
+        return importlib.import_module("pexpect_mcp.server")
+    finally:
+        sys.platform = real_platform
+        sys.modules.pop("pexpect_mcp.server", None)
+
+
+def test_winpty_expect():
+    """Test WinPtySpawn.expect scanning behavior across polls and calls."""
+    server = load_win32_server()
+
+    try:
+        # Test 1: a timed-out expect must not blind later calls to data that
+        # was already in the buffer (the scan offset is per-call state)
+        print("Test 1: expect rescans buffered data after a timeout...")
+        child = server.WinPtySpawn("cmd")
+        child.proc.feed("abcdefghij READY xyz")
+        try:
+            child.expect("zz_no_match", timeout=0.5)
+            raise AssertionError("expected a timeout")
+        except server.TimeoutError:
+            pass
+        assert child.expect("READY", timeout=2) == 0
+        assert child.before == "abcdefghij ", f"unexpected before: {child.before!r}"
+        child.close()
+        print("  PASS: buffered data matched after earlier timeout")
+
+        # Test 2: a regex match assembled across two reads must be found even
+        # though earlier polls already scanned the first half
+        print("Test 2: regex match straddling a poll boundary...")
+        child = server.WinPtySpawn("cmd")
+        child.proc.feed("ERROR " + "x" * 50)
+        threading.Timer(0.5, lambda: child.proc.feed(" DONE")).start()
+        assert child.expect("ERROR.*DONE", timeout=5) == 0
+        child.close()
+        print("  PASS: straddling regex match found")
+
+        # Test 3: same for a literal split across two reads, which exercises
+        # the str.find fast path's rewind-by-longest-literal logic
+        print("Test 3: literal match straddling a poll boundary...")
+        child = server.WinPtySpawn("cmd")
+        child.proc.feed("PRO")
+        threading.Timer(0.5, lambda: child.proc.feed("MPT>")).start()
+        assert child.expect("PROMPT>", timeout=5) == 0
+        child.close()
+        print("  PASS: straddling literal match found")
+
+        print("\nAll tests passed!")
+        return 0
+
+    except AssertionError as e:
+        print(f"\nTest FAILED: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_winpty_expect())